@@ -0,0 +1,51 @@
+"""
+Helpers shared by the test scripts for running requests concurrently:
+the in-flight request limit and readable per-task output
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import io
+import os
+import sys
+
+def _concurrency_from_env():
+    """Read TEST_CONCURRENCY, rejecting values that would stall or crash a semaphore"""
+    value = int(os.environ.get("TEST_CONCURRENCY", "4"))
+    if value < 1:
+        raise ValueError(f"TEST_CONCURRENCY must be at least 1, got {value}")
+    return value
+
+# Cap on in-flight requests per suite so a small local server is not flooded
+CONCURRENCY = _concurrency_from_env()
+
+# Per-task output buffer, set by run_buffered
+_TASK_OUTPUT = contextvars.ContextVar("task_output", default=None)
+
+class TaskOutput:
+    """sys.stdout stand-in that sends each task's writes to its own buffer"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        return (_TASK_OUTPUT.get() or self.stream).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+async def run_buffered(coro):
+    """Await coro with its printed output captured, returning (result, output)"""
+    buf = io.StringIO()
+    _TASK_OUTPUT.set(buf)
+    try:
+        result = await coro
+    except Exception as e:
+        result = e
+    return result, buf.getvalue()
+
+async def gather_buffered(*coros):
+    """Run coros concurrently, returning (result, output) pairs in order"""
+    with contextlib.redirect_stdout(TaskOutput(sys.stdout)):
+        return await asyncio.gather(*(run_buffered(coro) for coro in coros))
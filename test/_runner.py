@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Run both test scripts in one process, sharing a single event loop and
+keeping each suite's connection pool open for the whole run
+"""
+
+import asyncio
+import sys
+
+import test_claude_api
+import test_env_loading
+
+async def run_all():
+    async with test_env_loading.make_session() as env_session, \
+            test_env_loading.make_client() as env_client, \
+            test_claude_api.make_client() as api_client:
+        env_status = await test_env_loading.main(env_session, env_client)
+        api_status = await test_claude_api.main(api_client)
+    return max(env_status, api_status)
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run_all()))
@@ -5,95 +5,154 @@ This script demonstrates how to use the OpenAI client library
 to connect to the Claude Code API server.
 """
 
+import asyncio
+import httpx
 import openai
 import json
+import sys
 
-# Configure the client to use Claude Code API
-client = openai.OpenAI(
-    api_key="test-api-key",  # Your API key
-    base_url="http://localhost:8082/v1"  # Claude Code API server
-)
+from _output import CONCURRENCY
 
-def test_basic_chat():
+SEM = asyncio.Semaphore(CONCURRENCY)
+
+# Shared claude_options payloads, passed as extra_body.
+# Treat these as read-only: never mutate them in place.
+_WRITE_OPTS = {
+    "claude_options": {
+        "tools": ["Write"],
+        "working_dir": "/tmp",
+        "auto_allow_permissions": True
+    }
+}
+_BASH_OPTS = {
+    "claude_options": {
+        "tools": ["Bash"],
+        "working_dir": "/tmp",
+        "auto_allow_permissions": True
+    }
+}
+_READ_OPTS = {
+    "claude_options": {
+        "tools": ["Read"],
+        "files": ["/tmp/test_claude_api.py"],
+        "auto_allow_permissions": True
+    }
+}
+
+def make_client():
+    """Create the API client; closing it also closes its HTTP pool"""
+    # Keep-alive HTTP/1.1 pool shared by the concurrent requests
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=8, max_keepalive_connections=8, keepalive_expiry=60),
+        timeout=httpx.Timeout(connect=2.0, read=60.0, write=10.0, pool=5.0)
+    )
+    
+    # Configure the client to use Claude Code API
+    return openai.AsyncOpenAI(
+        api_key="test-api-key",  # Your API key
+        base_url="http://localhost:8082/v1",  # Claude Code API server
+        http_client=http_client
+    )
+
+async def print_stream(stream):
+    """Print a streamed completion as it arrives"""
+    print("Response: ", end="", flush=True)
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content or ""
+        print(delta, end="", flush=True)
+    print("\n")
+
+async def test_basic_chat(client):
     """Test basic chat completion"""
     print("1. Testing basic chat completion...")
-    response = client.chat.completions.create(
-        model="claude-code",
-        messages=[
-            {"role": "user", "content": "Say hello and tell me what day it is"}
-        ]
-    )
-    print(f"Response: {response.choices[0].message.content}\n")
+    async with SEM:
+        stream = await client.chat.completions.create(
+            model="claude-code",
+            messages=[
+                {"role": "user", "content": "Say hello and tell me what day it is"}
+            ],
+            stream=True
+        )
+        await print_stream(stream)
 
-def test_file_operations():
+async def test_file_operations(client):
     """Test file operations with auto permissions"""
     print("2. Testing file operations with auto permissions...")
-    response = client.chat.completions.create(
-        model="claude-code",
-        messages=[
-            {"role": "user", "content": "Create a file called test_output.txt with the content 'Claude Code API works!' in the current directory"}
-        ],
-        extra_body={
-            "claude_options": {
-                "tools": ["Write"],
-                "working_dir": "/tmp",
-                "auto_allow_permissions": True
-            }
-        }
-    )
-    print(f"Response: {response.choices[0].message.content}\n")
+    async with SEM:
+        stream = await client.chat.completions.create(
+            model="claude-code",
+            messages=[
+                {"role": "user", "content": "Create a file called test_output.txt with the content 'Claude Code API works!' in the current directory"}
+            ],
+            extra_body=_WRITE_OPTS,
+            stream=True
+        )
+        await print_stream(stream)
 
-def test_code_execution():
+async def test_code_execution(client):
     """Test code execution with Bash"""
     print("3. Testing code execution...")
-    response = client.chat.completions.create(
-        model="claude-code",
-        messages=[
-            {"role": "user", "content": "List all Python files in the current directory"}
-        ],
-        extra_body={
-            "claude_options": {
-                "tools": ["Bash"],
-                "working_dir": "/tmp",
-                "auto_allow_permissions": True
-            }
-        }
-    )
-    print(f"Response: {response.choices[0].message.content}\n")
+    async with SEM:
+        stream = await client.chat.completions.create(
+            model="claude-code",
+            messages=[
+                {"role": "user", "content": "List all Python files in the current directory"}
+            ],
+            extra_body=_BASH_OPTS,
+            stream=True
+        )
+        await print_stream(stream)
 
-def test_file_analysis():
+async def test_file_analysis(client):
     """Test file reading and analysis"""
     print("4. Testing file analysis...")
-    response = client.chat.completions.create(
-        model="claude-code",
-        messages=[
-            {"role": "user", "content": "Read this Python script and explain what it does"}
-        ],
-        extra_body={
-            "claude_options": {
-                "tools": ["Read"],
-                "files": ["/tmp/test_claude_api.py"],
-                "auto_allow_permissions": True
-            }
-        }
-    )
-    print(f"Response: {response.choices[0].message.content}\n")
+    async with SEM:
+        stream = await client.chat.completions.create(
+            model="claude-code",
+            messages=[
+                {"role": "user", "content": "Read this Python script and explain what it does"}
+            ],
+            extra_body=_READ_OPTS,
+            stream=True
+        )
+        await print_stream(stream)
 
-def main():
-    """Run all tests"""
+async def main(client=None):
+    """Run all tests concurrently, on a new client unless one is passed in"""
+    if client is None:
+        async with make_client() as client:
+            return await main(client)
+    
     print("=== Claude Code API Test Suite ===\n")
     
-    try:
-        test_basic_chat()
-        test_file_operations()
-        test_code_execution()
-        test_file_analysis()
-        
-        print("=== All tests completed! ===")
-        
-    except Exception as e:
-        print(f"Error: {e}")
+    tests = [
+        test_basic_chat,
+        test_file_operations,
+        test_code_execution,
+        test_file_analysis
+    ]
+    
+    # The requests are independent, so run them side by side on one client;
+    # their streamed output interleaves as the deltas arrive
+    results = await asyncio.gather(
+        *(test(client) for test in tests),
+        return_exceptions=True
+    )
+    
+    failed = 0
+    for test, result in zip(tests, results):
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"Error in {test.__name__}: {result}")
+    
+    if failed:
         print(f"Make sure the Claude Code API server is running on http://localhost:8082")
+        return 1
+    
+    print("=== All tests completed! ===")
+    return 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(asyncio.run(main()))
@@ -1,100 +1,168 @@
 #!/usr/bin/env python3
 """
 Test script to verify .env file loading functionality
+
+Requires aiohttp >= 3.10 for its connect/read timeout error types
 """
 
-import requests
-import json
+import aiohttp
+import asyncio
+import httpx
+import os
+import socket
 import sys
 import time
 
+try:
+    import orjson
+except ImportError:
+    import json as orjson  # same loads/dumps names, but dumps returns str
+
+from _output import CONCURRENCY, gather_buffered
+
 # Configuration
 BASE_URL = "http://localhost:8083"  # Port from .env file
 API_KEY = "test-api-key-123"  # API key from .env file
+AUTH_HEADERS = {"Authorization": f"Bearer {API_KEY}"}
+
+# Timeouts in seconds for the connect and read stages
+CONNECT_TIMEOUT, READ_TIMEOUT = 2.0, 30.0
+PROBE_CLIENT_TIMEOUT = aiohttp.ClientTimeout(sock_connect=CONNECT_TIMEOUT, sock_read=5.0)
+
+SEM = asyncio.Semaphore(CONCURRENCY)
+
+# Disable Nagle so small loopback POSTs are not held back by delayed ACKs,
+# and size the buffers so a request body goes out in one send()
+SOCKET_OPTIONS = [
+    (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+    (socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20),
+    (socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20),
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+]
+
+# Chat request body, encoded once and reused on every call
+_CHAT_BODY = orjson.dumps({
+    "model": "claude-code",
+    "messages": [
+        {"role": "user", "content": "Say 'Hello from .env test!'"}
+    ],
+    "max_tokens": 100
+})
+if isinstance(_CHAT_BODY, str):
+    _CHAT_BODY = _CHAT_BODY.encode("utf-8")
+_CHAT_HEADERS = {
+    "Content-Type": "application/json",
+    "Content-Length": str(len(_CHAT_BODY))
+}
+
+# Successful /v1/models results as (ts, (status, body)), keyed by
+# (url, whether an Authorization header was sent)
+_MODELS_CACHE = {}
+_MODELS_TTL = 1.0
+
+# Log scan results keyed by path, invalidated when the file's mtime changes
+_LOG_SCAN_CACHE = {}
+
+# Connect- and read-stage timeouts raised by the probe session and the client
+CONNECT_TIMEOUT_ERRORS = (aiohttp.ConnectionTimeoutError, httpx.ConnectTimeout)
+TIMEOUT_ERRORS = CONNECT_TIMEOUT_ERRORS + (aiohttp.SocketTimeoutError, httpx.ReadTimeout)
 
-def test_health_check():
+def timeout_diagnostic(label, error):
+    """Describe which stage of the request timed out"""
+    if isinstance(error, CONNECT_TIMEOUT_ERRORS):
+        return f"   ✗ {label}: could not connect within {CONNECT_TIMEOUT}s\n"
+    return f"   ✗ {label}: server accepted the connection but did not respond in time\n"
+
+async def test_health_check(session):
     """Test the health check endpoint"""
     print("1. Testing health check endpoint...")
     try:
-        response = requests.get(f"{BASE_URL}/health")
-        print(f"   Status: {response.status_code}")
-        print(f"   Response: {response.json()}")
-        assert response.status_code == 200
+        async with SEM, session.get(f"{BASE_URL}/health", timeout=PROBE_CLIENT_TIMEOUT) as response:
+            print(f"   Status: {response.status}")
+            print(f"   Response: {orjson.loads(await response.read())}")
+            assert response.status == 200
         print("   ✓ Health check passed\n")
+    except TIMEOUT_ERRORS as e:
+        print(timeout_diagnostic("Health check failed", e))
+        return False
     except Exception as e:
         print(f"   ✗ Health check failed: {e}\n")
         return False
     return True
 
-def test_root_endpoint():
+async def test_root_endpoint(session):
     """Test the root endpoint"""
     print("2. Testing root endpoint...")
     try:
-        response = requests.get(f"{BASE_URL}/")
-        print(f"   Status: {response.status_code}")
-        print(f"   Response: {response.json()}")
-        assert response.status_code == 200
+        async with SEM, session.get(f"{BASE_URL}/", timeout=PROBE_CLIENT_TIMEOUT) as response:
+            print(f"   Status: {response.status}")
+            print(f"   Response: {orjson.loads(await response.read())}")
+            assert response.status == 200
         print("   ✓ Root endpoint passed\n")
+    except TIMEOUT_ERRORS as e:
+        print(timeout_diagnostic("Root endpoint failed", e))
+        return False
     except Exception as e:
         print(f"   ✗ Root endpoint failed: {e}\n")
         return False
     return True
 
-def test_models_without_auth():
+async def test_models_without_auth(session):
     """Test models endpoint without authentication"""
     print("3. Testing models endpoint without auth...")
     try:
-        response = requests.get(f"{BASE_URL}/v1/models")
-        print(f"   Status: {response.status_code}")
-        print(f"   Response: {response.json()}")
-        assert response.status_code == 401
+        async with SEM, session.get(f"{BASE_URL}/v1/models", timeout=PROBE_CLIENT_TIMEOUT) as response:
+            print(f"   Status: {response.status}")
+            print(f"   Response: {orjson.loads(await response.read())}")
+            assert response.status == 401
         print("   ✓ Correctly rejected without auth\n")
+    except TIMEOUT_ERRORS as e:
+        print(timeout_diagnostic("Test failed", e))
+        return False
     except Exception as e:
         print(f"   ✗ Test failed: {e}\n")
         return False
     return True
 
-def test_models_with_auth():
+async def test_models_with_auth(session, use_cache=True):
     """Test models endpoint with authentication"""
     print("4. Testing models endpoint with auth...")
-    headers = {
-        "Authorization": f"Bearer {API_KEY}"
-    }
     try:
-        response = requests.get(f"{BASE_URL}/v1/models", headers=headers)
-        print(f"   Status: {response.status_code}")
-        print(f"   Response: {response.json()}")
-        assert response.status_code == 200
+        url = f"{BASE_URL}/v1/models"
+        key = (url, "Authorization" in AUTH_HEADERS)
+        now = time.monotonic()
+        cached = _MODELS_CACHE.get(key)
+        if use_cache and cached is not None and now - cached[0] < _MODELS_TTL:
+            status, body = cached[1]
+        else:
+            async with SEM, session.get(url, headers=AUTH_HEADERS, timeout=PROBE_CLIENT_TIMEOUT) as response:
+                status, body = response.status, orjson.loads(await response.read())
+            if status == 200:
+                _MODELS_CACHE[key] = (now, (status, body))
+        print(f"   Status: {status}")
+        print(f"   Response: {body}")
+        assert status == 200
         print("   ✓ Models endpoint passed with auth\n")
+    except TIMEOUT_ERRORS as e:
+        print(timeout_diagnostic("Test failed", e))
+        return False
     except Exception as e:
         print(f"   ✗ Test failed: {e}\n")
         return False
     return True
 
-def test_chat_completions():
+async def test_chat_completions(client):
     """Test chat completions endpoint"""
     print("5. Testing chat completions endpoint...")
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": "claude-code",
-        "messages": [
-            {"role": "user", "content": "Say 'Hello from .env test!'"}
-        ],
-        "max_tokens": 100
-    }
-    
     try:
-        response = requests.post(
-            f"{BASE_URL}/v1/chat/completions",
-            headers=headers,
-            json=data
+        response = await client.post(
+            "/v1/chat/completions",
+            content=_CHAT_BODY,
+            headers=_CHAT_HEADERS
         )
         print(f"   Status: {response.status_code}")
         if response.status_code == 200:
-            result = response.json()
+            result = orjson.loads(response.content)
             print(f"   Model used: {result.get('model', 'N/A')}")
             if 'choices' in result and len(result['choices']) > 0:
                 print(f"   Response: {result['choices'][0]['message']['content']}")
@@ -102,63 +170,162 @@ def test_chat_completions():
         else:
             print(f"   Response: {response.text}")
             return False
+    except TIMEOUT_ERRORS as e:
+        print(timeout_diagnostic("Test failed", e))
+        return False
     except Exception as e:
         print(f"   ✗ Test failed: {e}\n")
         return False
     return True
 
-def check_server_logs():
-    """Check server logs for .env loading"""
+def scan_server_log(path):
+    """Stream the log once, returning (found_port, found_auth)"""
+    mtime = os.stat(path).st_mtime
+    cached = _LOG_SCAN_CACHE.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    
+    found_port = found_auth = False
+    with open(path, 'r', buffering=1 << 16) as f:
+        for line in f:
+            if not found_port and 'Listening on' in line and ':8083' in line:
+                found_port = True
+            if not found_auth and 'API Key authentication enabled' in line:
+                found_auth = True
+            if found_port and found_auth:
+                break
+    
+    _LOG_SCAN_CACHE[path] = (mtime, (found_port, found_auth))
+    return found_port, found_auth
+
+def check_server_logs(scan=None):
+    """Check server logs for .env loading, reusing a finished scan if given"""
     print("6. Checking server logs for .env loading...")
     try:
-        with open('server.log', 'r') as f:
-            logs = f.read()
-            if 'Listening on' in logs and ':8083' in logs:
-                print("   ✓ Server is using port 8083 from .env file")
-            else:
-                print("   ✗ Server might not be using .env configuration")
-            
-            if 'API Key authentication enabled' in logs:
-                print("   ✓ API key authentication is enabled")
-            else:
-                print("   ✗ API key might not be loaded from .env")
+        if scan is None:
+            scan = scan_server_log('server.log')
+        if isinstance(scan, Exception):
+            raise scan
+        found_port, found_auth = scan
+        if found_port:
+            print("   ✓ Server is using port 8083 from .env file")
+        else:
+            print("   ✗ Server might not be using .env configuration")
+        
+        if found_auth:
+            print("   ✓ API key authentication is enabled")
+        else:
+            print("   ✗ API key might not be loaded from .env")
     except Exception as e:
         print(f"   ⚠ Could not read server logs: {e}")
+    return True
+
+async def wait_ready(client, path, deadline_s=10.0):
+    """Poll path with exponential backoff until it answers 200 or the deadline passes"""
+    start = time.monotonic()
+    delay = 0.05
+    while time.monotonic() - start < deadline_s:
+        try:
+            response = await client.get(path, timeout=1.0)
+            if response.status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
+    return False
+
+def make_session():
+    """Create the aiohttp session used by the probes"""
+    connector = aiohttp.TCPConnector(limit=8, keepalive_timeout=30)
+    return aiohttp.ClientSession(connector=connector)
 
-def main():
+def make_client():
+    """Create the httpx client used by the readiness poll and chat call"""
+    # Single-attempt transport so a flaky connection never replays a POST,
+    # with enough pooled sockets to keep every test's connection warm
+    transport = httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(max_keepalive_connections=8, max_connections=8, keepalive_expiry=30.0),
+        retries=0,
+        socket_options=SOCKET_OPTIONS
+    )
+    return httpx.AsyncClient(
+        base_url=BASE_URL,
+        transport=transport,
+        timeout=httpx.Timeout(CONNECT_TIMEOUT, read=READ_TIMEOUT),
+        headers=AUTH_HEADERS
+    )
+
+async def main(session=None, client=None):
+    """Run the suite, creating (and closing) any session or client not passed in"""
+    if session is None:
+        async with make_session() as session:
+            return await main(session, client)
+    if client is None:
+        async with make_client() as client:
+            return await main(session, client)
+    
     print("=== Testing Claude Code API with .env Loading ===\n")
     print("Expected configuration from .env:")
     print(f"  PORT: 8083")
     print(f"  API_KEY: {API_KEY}")
     print(f"  LOG_LEVEL: debug\n")
     
-    # Wait a bit for server to fully start
     print("Waiting for server to start...")
-    time.sleep(2)
+    if not await wait_ready(client, "/health"):
+        print("Server never became ready")
+        return 1
+    
+    # The readiness poll already warmed the client; pre-open a keep-alive
+    # connection on the probe session too, outside the tests themselves
+    try:
+        async with session.get(f"{BASE_URL}/health", timeout=aiohttp.ClientTimeout(total=2.0)) as response:
+            await response.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        pass  # warmup only
     
-    # Run tests
-    tests = [
-        test_health_check,
-        test_root_endpoint,
-        test_models_without_auth,
-        test_models_with_auth,
-        test_chat_completions,
-        check_server_logs
-    ]
+    # Wave A: side-effect free probes, run together with their output
+    # buffered so it can be replayed in a fixed order
+    wave_a = await gather_buffered(
+        test_health_check(session),
+        test_root_endpoint(session),
+        test_models_without_auth(session),
+        # Always hit the server here so the suite never reports a cached pass
+        test_models_with_auth(session, use_cache=False)
+    )
+    for _, output in wave_a:
+        sys.stdout.write(output)
+    wave_a_results = [result for result, _ in wave_a]
+    
+    health_ok = wave_a_results[0] is True
+    if not health_ok:
+        print("Aborting: server unhealthy")
+        return 1
+    
+    # Wave B: the chat call only runs against a server that passed wave A.
+    # The log is scanned in a worker thread meanwhile and that result is
+    # reported, rather than rescanning a log the chat call has appended to.
+    log_scan = asyncio.get_running_loop().run_in_executor(None, scan_server_log, 'server.log')
+    if all(result is True for result in wave_a_results):
+        chat_ok = await test_chat_completions(client)
+    else:
+        print("5. Skipping chat completions: earlier tests failed\n")
+        chat_ok = False
+    (scan,) = await asyncio.gather(log_scan, return_exceptions=True)
+    log_ok = check_server_logs(scan)
     
-    passed = 0
-    for test in tests:
-        if test():
-            passed += 1
+    results = [*wave_a_results, chat_ok, log_ok]
+    passed = sum(result is True for result in results)
+    total = len(results)
     
-    print(f"\n=== Summary: {passed}/{len(tests)} tests passed ===")
+    print(f"\n=== Summary: {passed}/{total} tests passed ===")
     
-    if passed == len(tests):
+    if passed == total:
         print("\n✓ All tests passed! The .env file is being loaded correctly.")
         return 0
     else:
-        print(f"\n✗ {len(tests) - passed} tests failed.")
+        print(f"\n✗ {total - passed} tests failed.")
         return 1
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(asyncio.run(main()))